@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+On-disk format and connection tuning of the SQLite database shared by the loader and the web server.
+"""
+
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+# Per-connection SQLite tuning: a 64 MiB page cache (negative sizes are in KiB) and up to
+# 256 MiB of the database file read through mmap instead of read() calls
+SQLITE_CACHE_SIZE = -65536
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+
+# Sensor timestamps are stored as integer microseconds since the Unix epoch (UTC), so range
+# queries and MAX() compare integers on the table's rowid instead of ISO strings
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def to_epoch_us(timestamp):
+    """Convert a datetime to integer microseconds since the epoch; naive values are taken as UTC."""
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return (timestamp - EPOCH) // timedelta(microseconds=1)
+
+def from_epoch_us(value):
+    """Convert integer microseconds since the epoch to an aware UTC datetime."""
+    return EPOCH + timedelta(microseconds=value)
+
+def connect(db_path):
+    """Open a database connection with the shared journal and per-connection tuning applied."""
+    # sqlite3 already retries a locked database for up to 5 seconds (timeout=5.0)
+    conn = sqlite3.connect(db_path)
+    # In WAL mode web server reads never block loader writes and vice versa, and
+    # synchronous=NORMAL is durable there without an fsync on every commit. Whichever
+    # process opens the database first sets WAL; it then persists in the file
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    # Page cache, temp tables and memory-mapped reads are per-connection settings
+    conn.execute(f'PRAGMA cache_size={SQLITE_CACHE_SIZE}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute(f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}')
+    return conn
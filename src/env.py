@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""
+Loading of KEY=value settings from the project's .env file into the environment.
+"""
+
+import os
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent
+
+def load_env_file(env_path=project_root / '.env'):
+    """Load KEY=value lines from a .env file into os.environ, if the file exists."""
+    if not env_path.exists():
+        return
+
+    with open(env_path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#') and '=' in line:
+                key, value = line.split('=', 1)
+                os.environ[key] = value
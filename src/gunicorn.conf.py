@@ -2,17 +2,31 @@
 # You can override these settings with command line arguments
 
 import os
+import sys
+from pathlib import Path
+
+# Settings below can also come from the project's .env file
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.env import load_env_file
+load_env_file()
 
 # Server socket
 bind = f"0.0.0.0:{os.getenv('FLASK_PORT', '3300')}"
 backlog = 2048
 
-# Worker processes
-workers = int(os.getenv('GUNICORN_WORKERS', '4'))
-worker_class = "sync"
-worker_connections = 1000
+# Worker processes, each serving requests on a pool of threads. Requests mostly wait on
+# SQLite or on cached responses; plot rendering holds the GIL, so processes still provide
+# the CPU parallelism
+workers = int(os.getenv('GUNICORN_WORKERS', '2'))
+worker_class = "gthread"
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
 timeout = 30
-keepalive = 2
+
+# A page load fetches the page, then /data and, as a fallback, /plot for the chosen plot,
+# and every change of plot type or period fetches more; keeping the browser's connection
+# open lets these reuse it. gthread workers park idle keep-alive connections in their
+# poller, so they do not hold a thread while waiting
+keepalive = 75
 
 # Restart workers after this many requests, to prevent memory leaks
 max_requests = 1000
@@ -7,17 +7,35 @@ and stores them in SQLite database.
 import os
 import sqlite3
 import requests
-import json
-import calendar
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 import sys
 import time
+import logging
 from pathlib import Path
 
 # Add the project root to the path so we can import from src
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
+from src.env import load_env_file
+from src.db import connect, to_epoch_us, from_epoch_us
+
+logger = logging.getLogger(__name__)
+
+# Minimum number of seconds between the starts of consecutive history chunk requests
+HISTORY_REQUEST_SPACING = 0.5
+
+# How far back a run resumes from the latest stored reading. Home Assistant only records
+# state changes, so an unchanged or unavailable sensor never moves that reading forward;
+# longer gaps are covered by the month of history loaded at startup
+RESUME_MAX_LOOKBACK = timedelta(days=1)
+
+# Home Assistant states that mark a missing reading rather than a value
+UNAVAILABLE_STATES = frozenset({None, 'unknown', 'unavailable'})
+
 class HomeAssistantLoader:
     def __init__(self):
         # Load environment variables
@@ -33,116 +51,165 @@ class HomeAssistantLoader:
         if not self.api_base.endswith('/api'):
             self.api_base = self.api_base.rstrip('/') + '/api'
         
+        # Keep connections to Home Assistant alive between requests, retrying transient failures
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Authorization': f'Bearer {self.token}',
+            'Content-Type': 'application/json'
+        })
+        adapter = HTTPAdapter(max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504]))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        
         # Use DATABASE_PATH env var if available (for Docker), otherwise use project root
         db_path_env = os.getenv('DATABASE_PATH')
         if db_path_env:
             self.db_path = Path(db_path_env)
         else:
             self.db_path = project_root / 'weather_data.db'
+        # One connection is opened lazily and reused for every query
+        self._conn = None
         self.init_database()
     
+    def get_connection(self):
+        """Get the loader's database connection, opening it on first use."""
+        if self._conn is None:
+            self._conn = connect(self.db_path)
+        return self._conn
+    
+    def close(self):
+        """Close the database connection; it is reopened if the loader is used again."""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+    
     def init_database(self):
         """Initialize the SQLite database with separate tables for temperature and humidity."""
         # Ensure the directory exists
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
         
-        conn = sqlite3.connect(self.db_path)
+        conn = self.get_connection()
         cursor = conn.cursor()
         
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS temperature_data (
-                timestamp DATETIME PRIMARY KEY,
+                timestamp INTEGER PRIMARY KEY,
                 value REAL
             )
         ''')
         
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS humidity_data (
-                timestamp DATETIME PRIMARY KEY,
+                timestamp INTEGER PRIMARY KEY,
                 value REAL
             )
         ''')
         
         conn.commit()
-        conn.close()
+        
+        # Databases created before epoch timestamps still have ISO string timestamps
+        for table_name in ('temperature_data', 'humidity_data'):
+            cursor.execute(f'PRAGMA table_info({table_name})')
+            column_types = {column[1]: column[2] for column in cursor.fetchall()}
+            if column_types.get('timestamp') != 'INTEGER':
+                self.migrate_timestamps(table_name)
+        
+        cursor.close()
+    
+    def migrate_timestamps(self, table_name):
+        """Rebuild a sensor table with ISO string timestamps as integer epoch microseconds."""
+        logger.info(f"Migrating {table_name} timestamps to epoch microseconds...")
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            # Run the whole rebuild in one transaction so it is never left half done
+            cursor.execute('BEGIN')
+            cursor.execute(f'ALTER TABLE {table_name} RENAME TO {table_name}_old')
+            cursor.execute(f'''
+                CREATE TABLE {table_name} (
+                    timestamp INTEGER PRIMARY KEY,
+                    value REAL
+                )
+            ''')
+            
+            cursor.execute(f'SELECT timestamp, value FROM {table_name}_old')
+            rows = []
+            for timestamp_str, value in cursor.fetchall():
+                try:
+                    rows.append((to_epoch_us(datetime.fromisoformat(timestamp_str)), value))
+                except (TypeError, ValueError):
+                    continue  # Skip rows without a parseable timestamp
+            cursor.executemany(f'''
+                INSERT INTO {table_name} (timestamp, value)
+                VALUES (?, ?)
+                ON CONFLICT (timestamp) DO NOTHING
+            ''', rows)
+            
+            cursor.execute(f'DROP TABLE {table_name}_old')
+            conn.commit()
+            logger.info(f"  Migrated {len(rows)} rows")
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.error(f"Database error migrating {table_name}: {e}")
+            raise
+        finally:
+            cursor.close()
     
     def fetch_sensor_state(self, entity_id):
         """Fetch the current state of a Home Assistant sensor."""
         url = f"{self.api_base}/states/{entity_id}"
-        headers = {
-            'Authorization': f'Bearer {self.token}',
-            'Content-Type': 'application/json'
-        }
         
         try:
-            response = requests.get(url, headers=headers, timeout=10)
+            response = self.session.get(url, timeout=10)
             response.raise_for_status()
             data = response.json()
             
             # Return the state value as float
             return float(data['state'])
         except requests.exceptions.RequestException as e:
-            print(f"Error fetching sensor {entity_id}: {e}")
+            logger.error(f"Error fetching sensor {entity_id}: {e}")
             return None
         except (ValueError, KeyError) as e:
-            print(f"Error parsing sensor data for {entity_id}: {e}")
+            logger.error(f"Error parsing sensor data for {entity_id}: {e}")
             return None
     
     def store_temperature(self, value, timestamp=None):
         """Store temperature data in the database with unique timestamp."""
         if timestamp is None:
             timestamp = datetime.now(timezone.utc)
-        
-        # Ensure timestamp is timezone-aware UTC
-        if timestamp.tzinfo is None:
-            timestamp = timestamp.replace(tzinfo=timezone.utc)
-        elif timestamp.tzinfo != timezone.utc:
-            timestamp = timestamp.astimezone(timezone.utc)
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('''
-                INSERT OR IGNORE INTO temperature_data (timestamp, value)
-                VALUES (?, ?)
-            ''', (timestamp.isoformat(), value))
-            
-            conn.commit()
-            return cursor.rowcount > 0  # Return True if row was inserted
-        except sqlite3.Error as e:
-            print(f"Database error storing temperature: {e}")
-            return False
-        finally:
-            conn.close()
+        return self.store_many('temperature_data', [(timestamp, value)]) > 0  # True if row was inserted
     
     def store_humidity(self, value, timestamp=None):
         """Store humidity data in the database with unique timestamp."""
         if timestamp is None:
             timestamp = datetime.now(timezone.utc)
+        return self.store_many('humidity_data', [(timestamp, value)]) > 0  # True if row was inserted
+    
+    def store_many(self, table_name, sensor_data):
+        """Store (timestamp, value) pairs in one transaction; return the number of rows inserted."""
+        rows = [(to_epoch_us(timestamp), value) for timestamp, value in sensor_data]
         
-        # Ensure timestamp is timezone-aware UTC
-        if timestamp.tzinfo is None:
-            timestamp = timestamp.replace(tzinfo=timezone.utc)
-        elif timestamp.tzinfo != timezone.utc:
-            timestamp = timestamp.astimezone(timezone.utc)
-        
-        conn = sqlite3.connect(self.db_path)
+        conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
-            cursor.execute('''
-                INSERT OR IGNORE INTO humidity_data (timestamp, value)
+            # Table name comes from code, never from input. Only duplicate timestamps are
+            # skipped; unlike INSERT OR IGNORE, any other constraint failure is still an error
+            cursor.executemany(f'''
+                INSERT INTO {table_name} (timestamp, value)
                 VALUES (?, ?)
-            ''', (timestamp.isoformat(), value))
+                ON CONFLICT (timestamp) DO NOTHING
+            ''', rows)
             
             conn.commit()
-            return cursor.rowcount > 0  # Return True if row was inserted
+            return max(cursor.rowcount, 0)  # Ignored duplicates are not counted
         except sqlite3.Error as e:
-            print(f"Database error storing humidity: {e}")
-            return False
+            conn.rollback()
+            logger.error(f"Database error storing into {table_name}: {e}")
+            return 0
         finally:
-            conn.close()
+            cursor.close()
     
     def fetch_historical_data(self, entity_id, start_time, end_time, max_days=10):
         """Fetch historical data for a sensor from Home Assistant, splitting into chunks if needed."""
@@ -153,214 +220,213 @@ class HomeAssistantLoader:
             # Calculate chunk end time (max_days from current_start or end_time, whichever is earlier)
             chunk_end = min(current_start + timedelta(days=max_days), end_time)
             
-            print(f"Fetching {entity_id} data from {current_start.strftime('%Y-%m-%d')} to {chunk_end.strftime('%Y-%m-%d')}")
+            logger.debug("Fetching %s data from %s to %s", entity_id, current_start, chunk_end)
             
             url = f"{self.api_base}/history/period/{current_start.isoformat()}"
-            headers = {
-                'Authorization': f'Bearer {self.token}',
-                'Content-Type': 'application/json'
-            }
             
+            # Only state and last_changed are read, so ask Home Assistant to leave out the
+            # attributes and full state objects, which make up most of each response
             params = {
                 'filter_entity_id': entity_id,
-                'end_time': chunk_end.isoformat()
+                'end_time': chunk_end.isoformat(),
+                'minimal_response': '',
+                'no_attributes': ''
             }
             
+            request_started = time.monotonic()
             try:
-                response = requests.get(url, headers=headers, params=params, timeout=30)
+                response = self.session.get(url, params=params, timeout=30)
                 response.raise_for_status()
                 data = response.json()
                 
-                # Extract data points
-                if data and len(data) > 0:
-                    for state_change in data[0]:  # First entity's data
-                        try:
-                            timestamp_str = state_change['last_changed']
-                            # Parse ISO format timestamp and ensure it's in UTC
-                            if timestamp_str.endswith('Z'):
-                                timestamp = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-                            else:
-                                timestamp = datetime.fromisoformat(timestamp_str)
-                            
-                            # Convert to UTC if not already
-                            if timestamp.tzinfo is None:
-                                timestamp = timestamp.replace(tzinfo=timezone.utc)
-                            else:
-                                timestamp = timestamp.astimezone(timezone.utc)
-                            
-                            value = float(state_change['state'])
-                            all_historical_data.append((timestamp, value))
-                        except (ValueError, KeyError) as e:
-                            continue  # Skip invalid data points
+                # Extract data points. fromisoformat() accepts the trailing Z since Python 3.11,
+                # and store_many() converts any offset to UTC, so each point is parsed only once
+                state_changes = data[0] if data else []  # First entity's data
+                fetched_before = len(all_historical_data)
+                append = all_historical_data.append
+                parse_timestamp = datetime.fromisoformat
+                for state_change in state_changes:
+                    state = state_change.get('state')
+                    if state in UNAVAILABLE_STATES:
+                        continue  # The sensor had no reading, not worth an exception
+                    try:
+                        append((parse_timestamp(state_change['last_changed']), float(state)))
+                    except (ValueError, KeyError):
+                        continue  # Skip invalid data points
                 
-                print(f"  Fetched {len(data[0]) if data and len(data) > 0 else 0} records")
+                logger.debug("  Fetched %d records, %d valid", len(state_changes), len(all_historical_data) - fetched_before)
                 
             except requests.exceptions.RequestException as e:
-                print(f"Error fetching historical data for {entity_id} ({current_start} to {chunk_end}): {e}")
+                logger.error(f"Error fetching historical data for {entity_id} ({current_start} to {chunk_end}): {e}")
             except Exception as e:
-                print(f"Error parsing historical data for {entity_id} ({current_start} to {chunk_end}): {e}")
+                logger.error(f"Error parsing historical data for {entity_id} ({current_start} to {chunk_end}): {e}")
             
             # Move to next chunk
             current_start = chunk_end
             
-            # Small delay to be nice to the API
-            time.sleep(0.5)
-        
-        print(f"Total fetched for {entity_id}: {len(all_historical_data)} records")
-        print("Last timestamp fetched:", all_historical_data[-1][0] if all_historical_data else "None")
+            # Start chunk requests at least HISTORY_REQUEST_SPACING seconds apart to be nice to
+            # the API; time spent on the request and parsing counts towards it
+            if current_start < end_time:
+                delay = HISTORY_REQUEST_SPACING - (time.monotonic() - request_started)
+                if delay > 0:
+                    time.sleep(delay)
+        
+        logger.info(f"Total fetched for {entity_id}: {len(all_historical_data)} records")
+        logger.debug("Last timestamp fetched: %s", all_historical_data[-1][0] if all_historical_data else None)
         return all_historical_data
     
+    def fetch_both_histories(self, temp_start, humidity_start, end_time):
+        """Fetch temperature and humidity history concurrently; both calls are network-bound."""
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            temp_future = executor.submit(self.fetch_historical_data, self.temp_sensor, temp_start, end_time)
+            humidity_future = executor.submit(self.fetch_historical_data, self.humidity_sensor, humidity_start, end_time)
+            return temp_future.result(), humidity_future.result()
+    
     def load_last_month_data(self):
         """Load data from last month and store it in the database."""
         now = datetime.now(timezone.utc)
         start_time = (now - timedelta(days=30))
         end_time = now
 
-        print(f"Loading data from {start_time.strftime('%Y-%m-%d')} to {end_time.strftime('%Y-%m-%d')} (UTC)")
+        logger.info(f"Loading data from {start_time.strftime('%Y-%m-%d')} to {end_time.strftime('%Y-%m-%d')} (UTC)")
         
         # Fetch historical data for both sensors
-        print("Fetching temperature data...")
-        temp_data = self.fetch_historical_data(self.temp_sensor, start_time, end_time)
-        
-        print("Fetching humidity data...")
-        humidity_data = self.fetch_historical_data(self.humidity_sensor, start_time, end_time)
+        logger.info("Fetching temperature and humidity data...")
+        temp_data, humidity_data = self.fetch_both_histories(start_time, start_time, end_time)
         
         # Store data using helper method
-        print("Storing fetched data:")
-        temp_stored, temp_skipped = self.store_sensor_data(temp_data, self.store_temperature, "Temperature")
-        humidity_stored, humidity_skipped = self.store_sensor_data(humidity_data, self.store_humidity, "Humidity")
+        logger.info("Storing fetched data:")
+        temp_stored, temp_skipped = self.store_sensor_data(temp_data, 'temperature_data', "Temperature")
+        humidity_stored, humidity_skipped = self.store_sensor_data(humidity_data, 'humidity_data', "Humidity")
 
-        print(f"Historical data loading completed:")
+        logger.info(f"Historical data loading completed:")
         
         # Print earliest dates stored
         earliest_temp = self.get_earliest_timestamp('temperature_data')
         earliest_humidity = self.get_earliest_timestamp('humidity_data')
         
         if earliest_temp:
-            print(f"  Earliest temperature data: {earliest_temp.strftime('%Y-%m-%d %H:%M:%S')} UTC")
+            logger.info(f"  Earliest temperature data: {earliest_temp.strftime('%Y-%m-%d %H:%M:%S')} UTC")
         else:
-            print("  No temperature data in database")
+            logger.info("  No temperature data in database")
             
         if earliest_humidity:
-            print(f"  Earliest humidity data: {earliest_humidity.strftime('%Y-%m-%d %H:%M:%S')} UTC")
+            logger.info(f"  Earliest humidity data: {earliest_humidity.strftime('%Y-%m-%d %H:%M:%S')} UTC")
         else:
-            print("  No humidity data in database")
+            logger.info("  No humidity data in database")
         
         return temp_stored + humidity_stored
 
     def run(self):
         """Fetch recent historical data and store it in the database."""
-        print(f"Fetching recent sensor data at {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')} UTC")
+        logger.info(f"Fetching recent sensor data at {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')} UTC")
         
-        # Fetch last hour of data to get the most recent readings
         end_time = datetime.now(timezone.utc)
-        start_time = end_time - timedelta(hours=1)
         
-        # Fetch and store temperature data
-        temp_data = self.fetch_historical_data(self.temp_sensor, start_time, end_time)
-        temp_stored, _ = self.store_sensor_data(temp_data, self.store_temperature, "Temperature")
+        # Fetch both sensors concurrently, then store on this thread, which owns the connection
+        temp_start = self.get_fetch_start_time('temperature_data', end_time)
+        humidity_start = self.get_fetch_start_time('humidity_data', end_time)
+        temp_data, humidity_data = self.fetch_both_histories(temp_start, humidity_start, end_time)
         
-        # Fetch and store humidity data  
-        humidity_data = self.fetch_historical_data(self.humidity_sensor, start_time, end_time)
-        humidity_stored, _ = self.store_sensor_data(humidity_data, self.store_humidity, "Humidity")
+        temp_stored, _ = self.store_sensor_data(temp_data, 'temperature_data', "Temperature")
+        humidity_stored, _ = self.store_sensor_data(humidity_data, 'humidity_data', "Humidity")
         
         if temp_stored > 0 or humidity_stored > 0:
-            print(f"Stored recent data - Temperature: {temp_stored}, Humidity: {humidity_stored}")
+            logger.info(f"Stored recent data - Temperature: {temp_stored}, Humidity: {humidity_stored}")
             return True
         else:
-            print("No new data to store")
+            logger.info("No new data to store")
             return True  # Still return True as this is normal
     
     def run_continuously(self, interval_minutes=2):
         """Run the loader continuously at specified intervals."""
-        print(f"Starting continuous data collection every {interval_minutes} minutes")
-        print("Press Ctrl+C to stop")
+        logger.info(f"Starting continuous data collection every {interval_minutes} minutes")
+        logger.info("Press Ctrl+C to stop")
+        
+        # Runs are scheduled against a monotonic deadline, so the time each run takes does not
+        # push every later run back
+        interval_seconds = interval_minutes * 60
+        next_run = time.monotonic()
         
         while True:
             try:
-                success = self.run()
-                if not success:
-                    print("Data loading failed, will retry in next cycle")
+                try:
+                    success = self.run()
+                    if not success:
+                        logger.warning("Data loading failed, will retry in next cycle")
+                except Exception as e:
+                    logger.error(f"Unexpected error: {e}")
+                    logger.warning("Will retry in next cycle")
                 
-                print(f"Waiting {interval_minutes} minutes until next run...")
-                time.sleep(interval_minutes * 60)
+                next_run += interval_seconds
+                delay = next_run - time.monotonic()
+                if delay > 0:
+                    logger.info(f"Waiting {delay:.0f} seconds until next run...")
+                    time.sleep(delay)
+                else:
+                    next_run = time.monotonic()  # Fell behind, so start a new cadence from now
                 
             except KeyboardInterrupt:
-                print("\nStopping data collection...")
+                logger.info("Stopping data collection...")
+                self.close()
                 break
-            except Exception as e:
-                print(f"Unexpected error: {e}")
-                print(f"Will retry in {interval_minutes} minutes...")
-                time.sleep(interval_minutes * 60)
+    
+    def get_fetch_start_time(self, table_name, end_time):
+        """Get where to resume fetching: the latest stored reading within RESUME_MAX_LOOKBACK, or the last hour."""
+        latest = self.get_latest_timestamp(table_name)
+        if latest is None or latest >= end_time:
+            return end_time - timedelta(hours=1)
+        return max(latest, end_time - RESUME_MAX_LOOKBACK)
     
     def get_earliest_timestamp(self, table_name):
         """Get the earliest timestamp from a given table."""
-        conn = sqlite3.connect(self.db_path)
+        return self._get_timestamp_bound(table_name, 'MIN')
+    
+    def get_latest_timestamp(self, table_name):
+        """Get the latest timestamp from a given table."""
+        return self._get_timestamp_bound(table_name, 'MAX')
+    
+    def _get_timestamp_bound(self, table_name, aggregate):
+        """Get the MIN or MAX timestamp from a given table as an aware UTC datetime."""
+        conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
-            cursor.execute(f'SELECT MIN(timestamp) FROM {table_name}')
+            cursor.execute(f'SELECT {aggregate}(timestamp) FROM {table_name}')
             result = cursor.fetchone()
-            if result and result[0]:
-                # Parse the stored ISO format timestamp
-                timestamp_str = result[0]
-                if isinstance(timestamp_str, str):
-                    # Handle both with and without timezone info
-                    if timestamp_str.endswith('+00:00') or timestamp_str.endswith('Z'):
-                        timestamp = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-                    else:
-                        timestamp = datetime.fromisoformat(timestamp_str).replace(tzinfo=timezone.utc)
-                else:
-                    # Assume it's already a datetime object and make it UTC if needed
-                    timestamp = timestamp_str
-                    if timestamp.tzinfo is None:
-                        timestamp = timestamp.replace(tzinfo=timezone.utc)
-                
-                return timestamp.astimezone(timezone.utc)
+            if result and result[0] is not None:
+                return from_epoch_us(result[0])
             return None
         except sqlite3.Error as e:
-            print(f"Database error getting earliest timestamp from {table_name}: {e}")
+            logger.error(f"Database error getting {aggregate} timestamp from {table_name}: {e}")
             return None
         finally:
-            conn.close()
+            cursor.close()
 
-    def store_sensor_data(self, sensor_data, store_function, sensor_type):
+    def store_sensor_data(self, sensor_data, table_name, sensor_type):
         """Helper method to store sensor data and return statistics."""
-        stored = 0
-        skipped = 0
+        stored = self.store_many(table_name, sensor_data)
+        skipped = len(sensor_data) - stored
         
-        for timestamp, value in sensor_data:
-            success = store_function(value, timestamp)
-            if success:
-                stored += 1
-            else:
-                skipped += 1
-        
-        print(f"  {sensor_type} - Stored: {stored}, Skipped: {skipped}")
+        logger.info(f"  {sensor_type} - Stored: {stored}, Skipped: {skipped}")
         return stored, skipped
 
 def main():
     """Main function to run the loader."""
+    load_env_file()
+    
+    # LOG_LEVEL=DEBUG also shows per-chunk fetch progress
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(), format='%(asctime)s %(levelname)s %(message)s')
     try:
-        # Load .env file
-        env_path = project_root / '.env'
-        if env_path.exists():
-            with open(env_path) as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith('#') and '=' in line:
-                        key, value = line.split('=', 1)
-                        os.environ[key] = value
-        
         loader = HomeAssistantLoader()
         
         # Always load last month's data first
-        print("Loading historical data from last month...")
+        logger.info("Loading historical data from last month...")
         loader.load_last_month_data()
         loader.run_continuously(interval_minutes=2)
             
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error(f"Error: {e}")
         sys.exit(1)
 
 if __name__ == '__main__':
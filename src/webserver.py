@@ -5,17 +5,26 @@ Web server that displays current temperature and humidity data from SQLite datab
 
 import os
 import sqlite3
-from datetime import datetime, timedelta
+import atexit
+import queue
+import hashlib
+import gzip
+import json
+import threading
+import time
+import logging
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+from functools import lru_cache
 from pathlib import Path
 import sys
-import pytz
-from flask import Flask, render_template, send_file, request
+from flask import Flask, render_template, send_file, request, jsonify
 import matplotlib
 matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+from matplotlib.figure import Figure
+import numpy as np
 import io
-import base64
 
 # Set matplotlib timezone to Novosibirsk
 matplotlib.rcParams['timezone'] = 'Asia/Novosibirsk'
@@ -24,10 +33,148 @@ matplotlib.rcParams['timezone'] = 'Asia/Novosibirsk'
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
+from src.env import load_env_file
+from src.db import connect, to_epoch_us, from_epoch_us
+
+logger = logging.getLogger(__name__)
+
 # Configure Flask to use templates from src/templates
 template_dir = Path(__file__).parent / 'templates'
 app = Flask(__name__, template_folder=str(template_dir))
 
+# Novosibirsk timezone, loaded from tzdata once per process. zoneinfo caches its transitions,
+# so converting a timestamp needs no per-call localize step
+TIMEZONE = ZoneInfo('Asia/Novosibirsk')
+
+# Series stored in the database, and everything that can be plotted
+SERIES_TYPES = frozenset({'temperature', 'humidity'})
+PLOT_TYPES = SERIES_TYPES | {'temp_hum'}
+
+# Line color, unit and title name for single-series plots. The unit is part of the title,
+# so the y-axis has no label of its own
+SERIES_PLOT_STYLES = {
+    'temperature': ('red', '°C', 'Температура'),
+    'humidity': ('blue', '%', 'Влажность')
+}
+
+# Supported plot periods and how far back each one reaches
+PERIODS = {
+    '24h': timedelta(hours=24),
+    'week': timedelta(days=7),
+    'month': timedelta(days=30)
+}
+
+# X-axis tick label format and tick locator factory for each period. Locators are bound
+# to an axis, so a fresh one is created per plot
+PERIOD_AXIS_TICKS = {
+    '24h': ('%H:%M', lambda: mdates.HourLocator(interval=4)),
+    'week': ('%m-%d %H:%M', lambda: mdates.DayLocator(interval=1)),
+    'month': ('%m-%d', lambda: mdates.DayLocator(interval=4))
+}
+
+# Relative time units as (exclusive upper bound in seconds, unit length in seconds, label)
+RELATIVE_TIME_UNITS = (
+    (60, 1, 'сек.'),
+    (3600, 60, 'мин.'),
+    (86400, 3600, 'ч.'),
+    (2592000, 86400, 'дн.'),
+    (float('inf'), 2592000, 'мес.')
+)
+
+# Plots are rendered up to a "now" rounded down to this many seconds, so requests
+# within the same window share one cached image
+PLOT_CACHE_SECONDS = 60
+
+# How long after a plot response expires clients may keep using it while fetching a new one.
+# Together with PLOT_CACHE_SECONDS this stays below the page's 5 minute auto-refresh, so a
+# reloaded page never shows the plot from the previous refresh
+PLOT_STALE_SECONDS = 120
+
+# gzip level for the rendered index page. Plot JSON is compressed once per version at the
+# default level; PNG plots are already compressed and are sent as they are
+HTML_GZIP_LEVEL = 4
+
+# Row layout of (value, timestamp) results read from the sensor tables, whose timestamps
+# are integer microseconds since the Unix epoch (UTC), see src/db.py
+SERIES_ROW_DTYPE = np.dtype([('value', np.float64), ('timestamp', 'datetime64[us]')])
+
+# Plots are 1200 px wide; more points than two per pixel column are not visible
+PLOT_MAX_POINTS = 2400
+
+# Figures are reused between renders on the same thread. They are created outside of
+# pyplot, so nothing keeps them alive once the thread exits
+_thread_figures = threading.local()
+
+def get_figure(figsize):
+    """Get a cleared figure of the given size, private to the current thread."""
+    figures = getattr(_thread_figures, 'by_size', None)
+    if figures is None:
+        figures = _thread_figures.by_size = {}
+    
+    fig = figures.get(figsize)
+    if fig is None:
+        # The tight layout engine runs as part of the single draw in savefig()
+        fig = figures[figsize] = Figure(figsize=figsize, layout='tight')
+    else:
+        fig.clf()
+    return fig
+
+def downsample_lttb(x, y, n_out):
+    """Pick indices of n_out points that keep the visual shape of a series (Largest-Triangle-Three-Buckets)."""
+    n = len(x)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    
+    # The first and last points are always kept; the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    
+    # Third vertex of each bucket's triangle is the average of the next bucket (or the last
+    # point). It does not depend on earlier picks, so all of them are computed up front
+    starts, counts = edges[:-1], np.diff(edges)
+    next_x = np.append(np.add.reduceat(x[:-1], starts)[1:] / counts[1:], x[-1])
+    next_y = np.append(np.add.reduceat(y[:-1], starts)[1:] / counts[1:], y[-1])
+    
+    # Each pick depends on the previous one, so this part stays a loop over the buckets
+    selected = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # Keep the point forming the largest triangle with the previously kept point
+        areas = np.abs((x[selected] - next_x[i]) * (y[start:end] - y[selected])
+                       - (x[selected] - x[start:end]) * (next_y[i] - y[selected]))
+        selected = start + int(areas.argmax())
+        keep[i + 1] = selected
+    
+    return keep
+
+# Database connections are reused between requests on the same thread, like the figures
+# above. Opened lazily, so none is inherited by gunicorn workers forked after preload
+_thread_connections = threading.local()
+
+# The loader stores new readings every couple of minutes, so the latest rows shown on the
+# index page are reused for this many seconds. Cached as {db_path: (monotonic time, rows)}
+LATEST_READINGS_CACHE_SECONDS = 15
+_latest_readings_cache = {}
+
+# Visitor statistics scan and group the whole user_requests window, so they are reused for
+# this many seconds. Cached as {(db_path, days): (monotonic time, (daily stats, unique IPs))}
+VISITOR_STATS_CACHE_SECONDS = 30
+_visitor_stats_cache = {}
+
+# Database paths whose user_requests table has been created by this process. The schema
+# only needs to be ensured once per process; a failed attempt is retried on the next request
+_initialized_db_paths = set()
+_init_lock = threading.Lock()
+
+# User requests are logged through a queue that one background thread per process writes
+# to the shared server's database in batches, so responses never wait for an insert and
+# its commit. The thread is started on first use, after gunicorn has forked the worker
+REQUEST_LOG_BATCH_SIZE = 500
+REQUEST_LOG_FLUSH_SECONDS = 0.25
+_request_log_queue = queue.Queue()
+_request_log_writer = None
+
 class WeatherWebServer:
     def __init__(self):
         # Use DATABASE_PATH env var if available (for Docker), otherwise use project root
@@ -36,10 +183,26 @@ class WeatherWebServer:
             self.db_path = Path(db_path_env)
         else:
             self.db_path = project_root / 'weather_data.db'
-        # Novosibirsk timezone
-        self.tz = pytz.timezone('Asia/Novosibirsk')
-        # Initialize user requests table
-        self._init_user_requests_table()
+        self.tz = TIMEZONE
+        self.ensure_user_requests_table()
+    
+    def ensure_user_requests_table(self):
+        """Initialize the user requests table once per process, until an attempt succeeds."""
+        if self.db_path not in _initialized_db_paths:
+            with _init_lock:
+                if self.db_path not in _initialized_db_paths and self._init_user_requests_table():
+                    _initialized_db_paths.add(self.db_path)
+    
+    def get_connection(self):
+        """Get this thread's database connection, opening it with the per-connection tuning on first use."""
+        connections = getattr(_thread_connections, 'by_path', None)
+        if connections is None:
+            connections = _thread_connections.by_path = {}
+        
+        conn = connections.get(self.db_path)
+        if conn is None:
+            conn = connections[self.db_path] = connect(self.db_path)
+        return conn
     
     def _init_user_requests_table(self):
         """Initialize the user_requests table if it doesn't exist."""
@@ -47,7 +210,7 @@ class WeatherWebServer:
             # Ensure the directory exists
             self.db_path.parent.mkdir(parents=True, exist_ok=True)
             
-            conn = sqlite3.connect(self.db_path)
+            conn = self.get_connection()
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -74,53 +237,78 @@ class WeatherWebServer:
             ''')
             
             conn.commit()
-            conn.close()
+            cursor.close()
+            return True
             
         except Exception as e:
-            print(f"Error initializing user_requests table: {e}")
+            logger.error(f"Error initializing user_requests table: {e}")
+            return False
     
     def log_user_request(self, ip_address, method, url, user_agent=None, referer=None):
-        """Log a user request to the database."""
+        """Queue a user request to be written to the database by the background log writer."""
+        # Use UTC timestamp for consistency
+        timestamp = datetime.now(timezone.utc).isoformat()
+        _request_log_queue.put((timestamp, ip_address, method, url, user_agent, referer))
+        start_request_log_writer()
+    
+    def write_user_requests(self, rows):
+        """Write a batch of user request rows in one transaction."""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            conn = self.get_connection()
             
-            # Use UTC timestamp for consistency
-            timestamp = datetime.now(pytz.UTC).isoformat()
-            
-            cursor.execute('''
-                INSERT INTO user_requests (timestamp, ip_address, method, url, user_agent, referer)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (timestamp, ip_address, method, url, user_agent, referer))
-            
-            conn.commit()
-            conn.close()
+            # The connection is reused, so commit on success and roll back on failure rather
+            # than leave a write transaction open on it
+            with conn:
+                conn.executemany('''
+                    INSERT INTO user_requests (timestamp, ip_address, method, url, user_agent, referer)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', rows)
             
         except Exception as e:
-            print(f"Error logging user request: {e}")
+            logger.error(f"Error logging {len(rows)} user requests: {e}")
     
-    def get_daily_visitor_stats(self, days=30):
-        """Get daily visitor statistics for the last N days."""
+    def get_visitor_stats(self, days=30):
+        """Get daily visitor statistics and the unique IP count for the last N days, cached for a short while."""
+        cache_key = (self.db_path, days)
+        cached = _visitor_stats_cache.get(cache_key)
+        if cached and time.monotonic() - cached[0] < VISITOR_STATS_CACHE_SECONDS:
+            return cached[1]
+        
+        stats = self._query_visitor_stats(days)
+        _visitor_stats_cache[cache_key] = (time.monotonic(), stats)
+        return stats
+    
+    def _query_visitor_stats(self, days):
+        """Query daily visitor statistics and the unique IP count for the last N days."""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.get_connection()
             cursor = conn.cursor()
+            window_start = visitor_window_start(days)
             
-            # Get visitor stats grouped by date
+            # Get visitor stats grouped by date. The raw timestamp is compared with an ISO string
+            # of the same format, so the window is a range search on idx_user_requests_timestamp
             cursor.execute('''
                 SELECT 
                     date(datetime(timestamp, 'localtime')) as visit_date,
                     COUNT(DISTINCT ip_address) as unique_visitors,
                     COUNT(*) as total_requests
                 FROM user_requests
-                WHERE datetime(timestamp) >= datetime('now', '-{} days')
+                WHERE timestamp >= ?
                 GROUP BY date(datetime(timestamp, 'localtime'))
                 ORDER BY visit_date DESC
-            '''.format(days))
-            
+            ''', (window_start,))
             results = cursor.fetchall()
-            conn.close()
             
-            return [
+            # Visitors seen on several days are counted once over the whole window
+            cursor.execute('''
+                SELECT COUNT(DISTINCT ip_address)
+                FROM user_requests
+                WHERE timestamp >= ?
+            ''', (window_start,))
+            total_unique_ips = cursor.fetchone()[0]
+            cursor.close()
+            
+            daily_stats = [
                 {
                     'date': result[0],
                     'unique_visitors': result[1],
@@ -128,10 +316,11 @@ class WeatherWebServer:
                 }
                 for result in results
             ]
+            return daily_stats, total_unique_ips
             
         except Exception as e:
-            print(f"Error getting daily visitor stats: {e}")
-            return []
+            logger.error(f"Error getting visitor stats: {e}")
+            return [], 0
     
     def format_relative_time(self, timestamp):
         """Format a timestamp as relative time (e.g., '5 minutes ago', '2 hours ago')."""
@@ -147,100 +336,70 @@ class WeatherWebServer:
         
         total_seconds = int(diff.total_seconds())
         
-        if total_seconds < 60:
-            return f"{total_seconds} сек. назад" if total_seconds != 1 else "1 сек. назад"
-        elif total_seconds < 3600:  # Less than 1 hour
-            minutes = total_seconds // 60
-            return f"{minutes} мин. назад" if minutes != 1 else "1 мин. назад"
-        elif total_seconds < 86400:  # Less than 1 day
-            hours = total_seconds // 3600
-            return f"{hours} ч. назад" if hours != 1 else "1 ч. назад"
-        elif total_seconds < 2592000:  # Less than 30 days
-            days = total_seconds // 86400
-            return f"{days} дн. назад" if days != 1 else "1 дн. назад"
-        else:
-            months = total_seconds // 2592000
-            return f"{months} мес. назад" if months != 1 else "1 мес. назад"
+        for limit, unit_seconds, unit in RELATIVE_TIME_UNITS:
+            if total_seconds < limit:
+                break
+        return f"{total_seconds // unit_seconds} {unit} назад"
+    
+    def get_latest_readings(self):
+        """Get the latest (value, timestamp) rows for temperature and humidity, cached for a short while."""
+        cached = _latest_readings_cache.get(self.db_path)
+        if cached and time.monotonic() - cached[0] < LATEST_READINGS_CACHE_SECONDS:
+            return cached[1]
+        
+        readings = self._query_latest_readings()
+        _latest_readings_cache[self.db_path] = (time.monotonic(), readings)
+        return readings
+    
+    def _query_latest_readings(self):
+        """Query the latest (value, timestamp) rows for temperature and humidity."""
+        # Ensure the directory exists
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        # Order by the raw column so the latest row is read from the end of the primary key
+        # index; wrapping it in datetime() forced a full scan and sort of the table
+        
+        # Get latest temperature
+        cursor.execute('''
+            SELECT value, timestamp
+            FROM temperature_data
+            ORDER BY timestamp DESC
+            LIMIT 1
+        ''')
+        temp_result = cursor.fetchone()
+        
+        # Get latest humidity
+        cursor.execute('''
+            SELECT value, timestamp
+            FROM humidity_data
+            ORDER BY timestamp DESC
+            LIMIT 1
+        ''')
+        humidity_result = cursor.fetchone()
+        
+        cursor.close()
+        return temp_result, humidity_result
     
     def get_latest_data(self):
         """Fetch the latest temperature and humidity data from the database."""
         try:
-            # Ensure the directory exists
-            self.db_path.parent.mkdir(parents=True, exist_ok=True)
-            
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Get latest temperature
-            cursor.execute('''
-                SELECT value, timestamp
-                FROM temperature_data
-                ORDER BY datetime(timestamp) DESC
-                LIMIT 1
-            ''')
-            temp_result = cursor.fetchone()
-            
-            # Get latest humidity
-            cursor.execute('''
-                SELECT value, timestamp
-                FROM humidity_data
-                ORDER BY datetime(timestamp) DESC
-                LIMIT 1
-            ''')
-            humidity_result = cursor.fetchone()
-            
-            conn.close()
+            temp_result, humidity_result = self.get_latest_readings()
             
             if temp_result or humidity_result:
                 temperature = round(temp_result[0], 1) if temp_result else None
                 humidity = round(humidity_result[0], 1) if humidity_result else None
                 
-                # Use the most recent timestamp for last_update
-                temp_time = None
-                humidity_time = None
-                
-                if temp_result:
-                    temp_timestamp_str = temp_result[1]
-                    if isinstance(temp_timestamp_str, str):
-                        temp_time = datetime.fromisoformat(temp_timestamp_str)
-                    else:
-                        temp_time = temp_timestamp_str
-                    # Handle both timezone-aware and naive timestamps
-                    if temp_time.tzinfo is None:
-                        temp_time = pytz.UTC.localize(temp_time)
-                    else:
-                        temp_time = temp_time.astimezone(pytz.UTC)
+                # Use the most recent timestamp for last_update. Epoch microseconds compare
+                # directly, so only the newest one is converted to a datetime
+                latest_time = from_epoch_us(max(result[1] for result in (temp_result, humidity_result) if result))
                 
-                if humidity_result:
-                    humidity_timestamp_str = humidity_result[1]
-                    if isinstance(humidity_timestamp_str, str):
-                        humidity_time = datetime.fromisoformat(humidity_timestamp_str)
-                    else:
-                        humidity_time = humidity_timestamp_str
-                    # Handle both timezone-aware and naive timestamps
-                    if humidity_time.tzinfo is None:
-                        humidity_time = pytz.UTC.localize(humidity_time)
-                    else:
-                        humidity_time = humidity_time.astimezone(pytz.UTC)
-                
-                # Use the most recent timestamp
-                latest_time = None
-                if temp_time and humidity_time:
-                    latest_time = max(temp_time, humidity_time)
-                elif temp_time:
-                    latest_time = temp_time
-                elif humidity_time:
-                    latest_time = humidity_time
-                
-                if latest_time:
-                    local_time = latest_time.astimezone(self.tz)
-                    last_update = local_time.strftime('%Y-%m-%d %H:%M:%S %Z')
-                    last_update_relative = self.format_relative_time(local_time)
-                    last_update_full = last_update
-                else:
-                    last_update = None
-                    last_update_relative = None
-                    last_update_full = None
+                local_time = latest_time.astimezone(self.tz)
+                last_update = local_time.strftime('%Y-%m-%d %H:%M:%S %Z')
+                last_update_relative = self.format_relative_time(local_time)
+                last_update_full = last_update
                 
                 return {
                     'temperature': temperature,
@@ -260,7 +419,7 @@ class WeatherWebServer:
                 
         except sqlite3.Error as e:
             # Log the actual error for debugging but don't expose details to users
-            print(f"Database error in get_latest_data: {e}")
+            logger.error(f"Database error in get_latest_data: {e}")
             return {
                 'temperature': None,
                 'humidity': None,
@@ -269,7 +428,7 @@ class WeatherWebServer:
             }
         except Exception as e:
             # Log the actual error for debugging but don't expose details to users
-            print(f"Error in get_latest_data: {e}")
+            logger.error(f"Error in get_latest_data: {e}")
             return {
                 'temperature': None,
                 'humidity': None,
@@ -278,166 +437,150 @@ class WeatherWebServer:
             }
     
     def get_data_by_date_range(self, data_type, start_date, end_date):
-        """Fetch temperature or humidity data for a specific date range."""
+        """Fetch temperature or humidity data for a specific date range, cached per data version."""
+        data_version = self.get_data_version(data_type)
+        if data_version is None:
+            return self._query_data_by_date_range(data_type, start_date, end_date)
+        return _cached_data_by_date_range(data_type, start_date, end_date, data_version)
+
+    def _query_data_by_date_range(self, data_type, start_date, end_date):
+        """Query and prepare temperature or humidity data for a specific date range."""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.get_connection()
             cursor = conn.cursor()
             
             # Validate and determine which table to query
-            if data_type not in ['temperature', 'humidity']:
+            if data_type not in SERIES_TYPES:
                 raise ValueError(f"Invalid data_type: {data_type}")
             
             table_name = f"{data_type}_data"
             
-            # Convert timezone-aware dates to UTC for database comparison
-            # Database stores naive UTC timestamps
-            start_utc = start_date.astimezone(pytz.UTC).replace(tzinfo=None)
-            end_utc = end_date.astimezone(pytz.UTC).replace(tzinfo=None)
-
-            print(f"Fetching {data_type} data from {start_utc} to {end_utc} in table {table_name}")
+            logger.debug("Fetching %s data from %s to %s in table %s", data_type, start_date, end_date, table_name)
             
             # Use safe string formatting for table name since SQLite doesn't support parameterized table names
-            # Use SQLite datetime() function for proper timestamp comparison
+            # Timestamps are the integer primary key (rowid), so the range is a rowid range search
             query = f'''
                 SELECT value, timestamp
                 FROM {table_name}
-                WHERE datetime(timestamp) >= datetime(?) AND datetime(timestamp) <= datetime(?)
-                ORDER BY datetime(timestamp) ASC
+                WHERE timestamp >= ? AND timestamp <= ?
+                ORDER BY timestamp ASC
             '''
-            cursor.execute(query, (start_utc.isoformat(), end_utc.isoformat()))
+            cursor.execute(query, (to_epoch_us(start_date), to_epoch_us(end_date)))
             
-            results = cursor.fetchall()
-            conn.close()
+            # Read rows straight from the cursor into numpy, without an intermediate list of
+            # tuples. Rows are already sorted by SQL. Timestamps stay naive UTC, which matplotlib
+            # expects (it displays them in the configured Novosibirsk timezone)
+            rows = np.fromiter(cursor, dtype=SERIES_ROW_DTYPE)
+            cursor.close()
             
-            if not results:
+            if not len(rows):
                 return None
-                
-            timestamps = []
-            values = []
-            
-            for value, timestamp_str in results:
-                # Parse timestamp - handle both timezone-aware and naive timestamps
-                if isinstance(timestamp_str, str):
-                    utc_time = datetime.fromisoformat(timestamp_str)
-                else:
-                    utc_time = timestamp_str
-                
-                # Handle both timezone-aware and naive timestamps
-                if utc_time.tzinfo is None:
-                    utc_time = pytz.UTC.localize(utc_time)
-                else:
-                    utc_time = utc_time.astimezone(pytz.UTC)
-                
-                local_time = utc_time.astimezone(self.tz)
-                
-                timestamps.append(local_time)
-                values.append(value)
+            
+            # Split into two contiguous arrays for the numeric work below
+            values = np.ascontiguousarray(rows['value'])
+            timestamps = np.ascontiguousarray(rows['timestamp'])
             
             # Extend the plot to the current time with the last known value
-            if timestamps and values:
-                last_timestamp = timestamps[-1]
-                last_value = values[-1]
-                
-                # If the last data point is before the end time, add a point at end time
-                if last_timestamp < end_date:
-                    timestamps.append(end_date)
-                    values.append(last_value)
+            end_utc64 = np.datetime64(to_epoch_us(end_date), 'us')
+            if timestamps[-1] < end_utc64:
+                timestamps = np.append(timestamps, end_utc64)
+                values = np.append(values, values[-1])
+            
+            # Statistics come from every sample, only the plotted series is downsampled
+            mean_val, min_val, max_val = float(values.mean()), float(values.min()), float(values.max())
+            
+            keep = downsample_lttb(timestamps.astype(np.float64), values, PLOT_MAX_POINTS)
+            if len(keep) < len(values):
+                timestamps, values = timestamps[keep], values[keep]
+            
+            # The arrays may be shared through the cache, so guard them against modification
+            timestamps.flags.writeable = False
+            values.flags.writeable = False
             
             return {
                 'timestamps': timestamps,
-                'values': values
+                'values': values,
+                'mean': mean_val,
+                'min': min_val,
+                'max': max_val
             }
             
         except Exception as e:
             # Log the actual error for debugging but don't expose details to users
-            print(f"Error fetching {data_type} data: {e}")
+            logger.error(f"Error fetching {data_type} data: {e}")
             return None
     
-    def get_date_range_for_period(self, period):
-        """Get start and end dates for a given period."""
-        # Validate period parameter
-        if period not in ['24h', 'week', 'month']:
-            period = '24h'  # Default to safe value
-            
-        now = datetime.now(self.tz)
+    def get_data_version(self, data_type):
+        """Get the latest stored timestamp(s) behind a plot; changes whenever new data arrives."""
+        table_names = ['temperature_data', 'humidity_data'] if data_type == 'temp_hum' else [f"{data_type}_data"]
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            # MAX() over the primary key is a single index lookup
+            latest = []
+            for table_name in table_names:
+                cursor.execute(f'SELECT MAX(timestamp) FROM {table_name}')
+                latest.append(str(cursor.fetchone()[0]))
+
+            cursor.close()
+            return '|'.join(latest)
+
+        except Exception as e:
+            logger.error(f"Error getting data version for {data_type}: {e}")
+            return None
+
+    def get_date_range_for_period(self, period, now=None):
+        """Get start and end dates for a given period, ending now unless given."""
+        if now is None:
+            now = datetime.now(self.tz)
         
-        if period == '24h':
-            start_date = now - timedelta(hours=24)
-        elif period == 'week':
-            start_date = now - timedelta(days=7)
-        elif period == 'month':
-            start_date = now - timedelta(days=30)
-        else:
-            # Default to 24 hours (should not reach here due to validation above)
-            start_date = now - timedelta(hours=24)
+        # Unknown periods default to 24 hours
+        start_date = now - PERIODS.get(period, PERIODS['24h'])
         
         return start_date, now
 
-    def _format_plot_axis(self, ax, start_date, end_date):
+    def _format_plot_axis(self, ax, start_date, end_date, period):
         """Format x-axis for plots with proper date/time formatting."""
         # Set x-axis limits to show the full date range with no gaps
         ax.set_xlim(start_date, end_date)
         
-        # Format x-axis based on date range
-        date_diff = (end_date - start_date).days
-        if date_diff <= 1:
-            # Less than or equal to 1 day - show hours
-            ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
-            ax.xaxis.set_major_locator(mdates.HourLocator(interval=max(1, date_diff * 4)))
-        elif date_diff <= 7:
-            # 1-7 days - show days and hours
-            ax.xaxis.set_major_formatter(mdates.DateFormatter('%m-%d %H:%M'))
-            ax.xaxis.set_major_locator(mdates.DayLocator(interval=1))
-        else:
-            # More than 7 days - show just dates
-            ax.xaxis.set_major_formatter(mdates.DateFormatter('%m-%d'))
-            ax.xaxis.set_major_locator(mdates.DayLocator(interval=max(1, date_diff // 7)))
+        # Format x-axis based on the plotted period
+        date_format, make_locator = PERIOD_AXIS_TICKS.get(period, PERIOD_AXIS_TICKS['24h'])
+        ax.xaxis.set_major_formatter(mdates.DateFormatter(date_format))
+        ax.xaxis.set_major_locator(make_locator())
         
-        plt.setp(ax.xaxis.get_majorticklabels(), rotation=45)
+        ax.tick_params(axis='x', labelrotation=45)
 
     def _save_plot_to_buffer(self, fig):
         """Save matplotlib figure to bytes buffer."""
-        plt.tight_layout()
         img_buffer = io.BytesIO()
-        plt.savefig(img_buffer, format='png', dpi=100, bbox_inches='tight')
+        # zlib level 1 is much cheaper to encode; the images are small and cached anyway
+        fig.savefig(img_buffer, format='png', dpi=100, pil_kwargs={'compress_level': 1})
         img_buffer.seek(0)
-        plt.close()
         return img_buffer
 
-    def generate_plot(self, data_type, start_date, end_date):
+    def generate_plot(self, data_type, start_date, end_date, period):
         """Generate a plot for the specified data type and date range."""
         if data_type == 'temp_hum':
-            return self.generate_combined_plot(start_date, end_date)
+            return self.generate_combined_plot(start_date, end_date, period)
         
         data = self.get_data_by_date_range(data_type, start_date, end_date)
         if not data:
             return self.generate_no_data_plot(f"N/A")
             
         # Calculate statistics
-        values = data['values']
-        mean_val = sum(values) / len(values)
-        min_val = min(values)
-        max_val = max(values)
+        mean_val = data['mean']
+        min_val = data['min']
+        max_val = data['max']
         
         # Create the plot
-        fig, ax = plt.subplots(figsize=(12, 8))
+        fig = get_figure((12, 8))
+        ax = fig.add_subplot()
         
         # Determine plot properties based on data type
-        if data_type == 'temperature':
-            color = 'red'
-            ylabel = ''
-            unit = '°C'
-            title = f'Температура, {unit} (с {start_date.strftime("%Y-%m-%d")} до {end_date.strftime("%Y-%m-%d")})'
-        elif data_type == 'humidity':
-            color = 'blue'
-            ylabel = ''
-            unit = '%'
-            title = f'Влажность, {unit} (с {start_date.strftime("%Y-%m-%d")} до {end_date.strftime("%Y-%m-%d")})'
-        else:
-            color = 'black'
-            ylabel = 'Значение'
-            unit = ''
-            title = f'{data_type} (с {start_date.strftime("%Y-%m-%d")} до {end_date.strftime("%Y-%m-%d")})'
+        color, unit, name = SERIES_PLOT_STYLES[data_type]
+        title = f'{name}, {unit} (с {start_date:%Y-%m-%d} до {end_date:%Y-%m-%d})'
 
         # Plot the data with horizontal connections between points
         ax.plot(data['timestamps'], data['values'], color=color, linewidth=2, drawstyle='steps-post')
@@ -447,16 +590,15 @@ class WeatherWebServer:
         ax.axhline(y=min_val, color='lightblue', linestyle='-', alpha=1, linewidth=1, label=f'Мин: {min_val:.1f}{unit}')
         ax.axhline(y=max_val, color='lightcoral', linestyle='-', alpha=1, linewidth=1, label=f'Макс: {max_val:.1f}{unit}')
         
-        ax.set_ylabel(ylabel, fontsize=12)
         ax.set_title(title, fontsize=14)
         ax.grid(True, alpha=0.3)
         ax.legend(loc='upper right', fontsize=10)
         
         # Format axis and save
-        self._format_plot_axis(ax, start_date, end_date)
+        self._format_plot_axis(ax, start_date, end_date, period)
         return self._save_plot_to_buffer(fig)
 
-    def generate_combined_plot(self, start_date, end_date):
+    def generate_combined_plot(self, start_date, end_date, period):
         """Generate a combined plot showing both temperature and humidity."""
         # Get data for both temperature and humidity
         temp_data = self.get_data_by_date_range('temperature', start_date, end_date)
@@ -466,13 +608,14 @@ class WeatherWebServer:
             return self.generate_no_data_plot("Нет данных для отображения")
         
         # Create the plot with dual y-axes
-        fig, ax1 = plt.subplots(figsize=(12, 8))
+        fig = get_figure((12, 8))
+        ax1 = fig.add_subplot()
         ax2 = ax1.twinx()
         
         # Plot humidity first (so it appears below temperature visually)
         if humidity_data:
             humidity_values = humidity_data['values']
-            humidity_mean = sum(humidity_values) / len(humidity_values)
+            humidity_mean = humidity_data['mean']
             
             ax2.plot(humidity_data['timestamps'], humidity_values, 
                     color='lightblue', linewidth=1, drawstyle='steps-post', 
@@ -482,14 +625,14 @@ class WeatherWebServer:
             ax2.tick_params(axis='y', labelcolor='blue')
             
             # Set humidity y-axis limits to create visual hierarchy
-            humidity_min, humidity_max = min(humidity_values), max(humidity_values)
+            humidity_min, humidity_max = humidity_data['min'], humidity_data['max']
             humidity_range = humidity_max - humidity_min
             ax2.set_ylim(humidity_min - humidity_range * 0.1, humidity_max + humidity_range * 0.1)
         
         # Plot temperature on top (visually dominant)
         if temp_data:
             temp_values = temp_data['values']
-            temp_mean = sum(temp_values) / len(temp_values)
+            temp_mean = temp_data['mean']
             
             ax1.plot(temp_data['timestamps'], temp_values, 
                     color='red', linewidth=1, drawstyle='steps-post', 
@@ -499,7 +642,7 @@ class WeatherWebServer:
             ax1.tick_params(axis='y', labelcolor='red')
             
             # Set temperature y-axis limits
-            temp_min, temp_max = min(temp_values), max(temp_values)
+            temp_min, temp_max = temp_data['min'], temp_data['max']
             temp_range = temp_max - temp_min
             ax1.set_ylim(temp_min - temp_range * 0.1, temp_max + temp_range * 0.1)
         
@@ -521,12 +664,41 @@ class WeatherWebServer:
             ax1.legend(lines1 + lines2, labels1 + labels2, loc='upper right', fontsize=10)
         
         # Format axis and save using shared methods
-        self._format_plot_axis(ax1, start_date, end_date)
+        self._format_plot_axis(ax1, start_date, end_date, period)
         return self._save_plot_to_buffer(fig)
 
+    def get_plot_series(self, data_type, start_date, end_date):
+        """Collect the series behind a plot as JSON-serializable data for client-side rendering."""
+        series_types = ['temperature', 'humidity'] if data_type == 'temp_hum' else [data_type]
+
+        series = []
+        for series_type in series_types:
+            data = self.get_data_by_date_range(series_type, start_date, end_date)
+            if not data:
+                continue
+
+            # Local wall-clock time without offset, so the browser shows Novosibirsk time as-is
+            local_times = np.datetime_as_string(data['timestamps'], unit='s', timezone=self.tz)
+            series.append({
+                'type': series_type,
+                'x': [local_time[:19] for local_time in local_times.tolist()],
+                'y': data['values'].tolist(),
+                'mean': data['mean'],
+                'min': data['min'],
+                'max': data['max']
+            })
+
+        return {
+            'data_type': data_type,
+            'start': start_date.strftime('%Y-%m-%dT%H:%M:%S'),
+            'end': end_date.strftime('%Y-%m-%dT%H:%M:%S'),
+            'series': series
+        }
+
     def generate_no_data_plot(self, message):
         """Generate a plot showing no data message."""
-        fig, ax = plt.subplots(figsize=(8, 8))
+        fig = get_figure((8, 8))
+        ax = fig.add_subplot()
         ax.text(0.5, 0.5, message, ha='center', va='center', fontsize=14)
         ax.set_xlim(0, 1)
         ax.set_ylim(0, 1)
@@ -534,6 +706,127 @@ class WeatherWebServer:
         
         return self._save_plot_to_buffer(fig)
 
+_server = None
+
+def get_server():
+    """Get the process-wide WeatherWebServer, creating it on first use.
+
+    It is created lazily rather than at import so that .env is loaded first and no
+    database connection is opened before gunicorn forks its workers. The user requests
+    table is ensured on every call, so a failed first attempt (e.g. while the loader holds
+    the database during a migration) is retried instead of lasting for the worker's life.
+    """
+    global _server
+    if _server is None:
+        _server = WeatherWebServer()
+    else:
+        _server.ensure_user_requests_table()
+    return _server
+
+@lru_cache(maxsize=16)
+def _cached_data_by_date_range(data_type, start_date, end_date, data_version):
+    """Query plot data once for both the PNG and JSON renderers.
+
+    data_version is only part of the cache key, as for the rendered plots.
+    """
+    return get_server()._query_data_by_date_range(data_type, start_date, end_date)
+
+@lru_cache(maxsize=16)
+def _render_plot_png(data_type, period, data_version, end_timestamp):
+    """Render a plot to PNG bytes.
+
+    data_version is only part of the cache key: it changes when new samples are
+    stored, so cached images are never served for outdated data.
+    """
+    server = get_server()
+    end_date = datetime.fromtimestamp(end_timestamp, server.tz)
+    start_date, end_date = server.get_date_range_for_period(period, now=end_date)
+    return server.generate_plot(data_type, start_date, end_date, period).getvalue()
+
+@lru_cache(maxsize=16)
+def _render_plot_json(data_type, period, data_version, end_timestamp):
+    """Serialize plot series to compact JSON bytes; cached the same way as the PNG plots."""
+    server = get_server()
+    end_date = datetime.fromtimestamp(end_timestamp, server.tz)
+    start_date, end_date = server.get_date_range_for_period(period, now=end_date)
+    series = server.get_plot_series(data_type, start_date, end_date)
+    return json.dumps(series, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+@lru_cache(maxsize=16)
+def _render_plot_json_gzip(data_type, period, data_version, end_timestamp):
+    """Gzip the plot JSON once per cached version rather than once per response.
+
+    The series text compresses several times over; PNG plots are already compressed
+    and are always sent as they are.
+    """
+    return gzip.compress(_render_plot_json(data_type, period, data_version, end_timestamp))
+
+def get_plot_version(server, data_type, period):
+    """Get the cache window end and ETag identifying the current plot for data_type/period."""
+    data_version = server.get_data_version(data_type)
+    end_timestamp = int(time.time()) // PLOT_CACHE_SECONDS * PLOT_CACHE_SECONDS
+    etag = hashlib.md5(f"{data_type}|{period}|{data_version}|{end_timestamp}".encode()).hexdigest()
+    return data_version, end_timestamp, etag
+
+def accepts_gzip():
+    """Whether the client accepts gzip; an explicit gzip;q=0 counts as refusing it."""
+    return request.accept_encodings['gzip'] > 0
+
+def not_modified(etag):
+    """Return a 304 response if the client already has this ETag, otherwise None."""
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+def visitor_window_start(days):
+    """Get the start of a visitor statistics window in the UTC ISO format user_requests are logged with."""
+    return (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+
+def start_request_log_writer():
+    """Start this process's request log writer thread if it is not running yet."""
+    global _request_log_writer
+    if _request_log_writer is not None:
+        return
+    with _init_lock:
+        if _request_log_writer is None:
+            _request_log_writer = threading.Thread(target=_run_request_log_writer, name='request-log-writer', daemon=True)
+            _request_log_writer.start()
+            atexit.register(stop_request_log_writer)
+
+def stop_request_log_writer():
+    """Stop the request log writer once it has written every request queued so far."""
+    # None tells the writer to stop; daemon threads still run while atexit handlers do
+    _request_log_queue.put(None)
+    _request_log_writer.join(timeout=5)
+
+def _run_request_log_writer():
+    """Write queued user requests, collecting up to a batch or a short flush interval at a time."""
+    stopping = False
+    while not stopping:
+        rows = []
+        deadline = None
+        while len(rows) < REQUEST_LOG_BATCH_SIZE:
+            if deadline is None:
+                row = _request_log_queue.get()  # Wait as long as it takes for the first row
+                deadline = time.monotonic() + REQUEST_LOG_FLUSH_SECONDS
+            else:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    row = _request_log_queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+            if row is None:
+                stopping = True
+                break
+            rows.append(row)
+        
+        if rows:
+            get_server().write_user_requests(rows)
+
 def get_client_ip():
     """Get the real client IP address, considering proxy headers."""
     # Check for X-Forwarded-For header (common with proxies/load balancers)
@@ -550,21 +843,34 @@ def get_client_ip():
 def log_request_info():
     """Log client IP and request headers."""
     client_ip = get_client_ip()
-    headers_str = "; ".join([f"{name}={value}" for name, value in request.headers])
-    print(f"Request: IP={client_ip} Method={request.method} URL={request.url} Headers=[{headers_str}]")
+    # Joining every header is only worth it when the line is actually logged
+    if logger.isEnabledFor(logging.DEBUG):
+        headers_str = "; ".join([f"{name}={value}" for name, value in request.headers])
+        logger.debug("Request: IP=%s Method=%s URL=%s Headers=[%s]", client_ip, request.method, request.url, headers_str)
     
     # Also log to database
-    server = WeatherWebServer()
+    server = get_server()
     user_agent = request.headers.get('User-Agent')
     referer = request.headers.get('Referer')
     server.log_user_request(client_ip, request.method, request.url, user_agent, referer)
 
+@app.after_request
+def set_plot_cache_headers(response):
+    """Let browsers and proxies reuse plot responses for the lifetime of a plot cache window."""
+    if request.path.startswith(('/plot/', '/data/')) and response.status_code in (200, 304):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = PLOT_CACHE_SECONDS
+        # Past max-age, browsers may show the stored plot at once while revalidating it
+        response.cache_control.stale_while_revalidate = PLOT_STALE_SECONDS
+    return response
+
 @app.route('/')
 def index():
     """Main route that displays the weather data."""
     log_request_info()
     
-    server = WeatherWebServer()
+    server = get_server()
     data = server.get_latest_data()
     
     # Get plot parameters from query string
@@ -572,51 +878,105 @@ def index():
     period = request.args.get('period', '24h')
     
     # Validate plot_type parameter
-    if plot_type not in ['temperature', 'humidity', 'temp_hum']:
+    if plot_type not in PLOT_TYPES:
         plot_type = 'temperature'  # Default to safe value
     
     # Validate period parameter
-    if period not in ['24h', 'week', 'month']:
+    if period not in PERIODS:
         period = '24h'  # Default to safe value
     
     # Add plot parameters to template data
     data['plot_type'] = plot_type
     data['period'] = period
     
-    return render_template('index.html', **data)
+    # The page is rendered per request, so it is compressed per request too; a low level
+    # keeps that cheap while still shrinking the markup and inline script several times over
+    response = app.response_class(render_template('index.html', **data), mimetype='text/html')
+    if accepts_gzip():
+        response.set_data(gzip.compress(response.get_data(), compresslevel=HTML_GZIP_LEVEL))
+        response.content_encoding = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
 
 @app.route('/plot/<data_type>')
 def plot(data_type):
     """Route that serves plots with period parameter."""
     log_request_info()
     
-    server = WeatherWebServer()
+    server = get_server()
     
     # Get period parameter
     period = request.args.get('period', '24h')
     
     # Validate period parameter
-    if period not in ['24h', 'week', 'month']:
+    if period not in PERIODS:
         period = '24h'  # Default to safe value
     
     # Validate data type
-    if data_type not in ['temperature', 'humidity', 'temp_hum']:
+    if data_type not in PLOT_TYPES:
         return "Invalid data type. Use 'temperature', 'humidity', or 'temp_hum'", 400
     
-    # Get date range for the period
-    start_date, end_date = server.get_date_range_for_period(period)
+    # Skip rendering entirely if the client already has this version
+    data_version, end_timestamp, etag = get_plot_version(server, data_type, period)
+    cached_response = not_modified(etag)
+    if cached_response:
+        return cached_response
     
-    # Generate plot
-    plot_buffer = server.generate_plot(data_type, start_date, end_date)
+    # Generate plot, reusing the cached image while the data is unchanged
+    plot_png = _render_plot_png(data_type, period, data_version, end_timestamp)
     
-    return send_file(plot_buffer, mimetype='image/png')
+    response = send_file(io.BytesIO(plot_png), mimetype='image/png')
+    response.set_etag(etag)
+    return response
+
+@app.route('/data/<data_type>')
+def plot_data(data_type):
+    """Route that serves raw plot series as JSON for client-side rendering."""
+    log_request_info()
+
+    server = get_server()
+
+    # Get period parameter
+    period = request.args.get('period', '24h')
+
+    # Validate period parameter
+    if period not in PERIODS:
+        period = '24h'  # Default to safe value
+
+    # Validate data type
+    if data_type not in PLOT_TYPES:
+        return jsonify({'error': "Invalid data type. Use 'temperature', 'humidity', or 'temp_hum'"}), 400
+
+    # The gzip and identity encodings are different representations, so they get different ETags
+    data_version, end_timestamp, etag = get_plot_version(server, data_type, period)
+    use_gzip = accepts_gzip()
+    if use_gzip:
+        etag += '-gzip'
+
+    # Skip the database queries entirely if the client already has this version
+    cached_response = not_modified(etag)
+    if cached_response:
+        cached_response.vary.add('Accept-Encoding')
+        return cached_response
+
+    if use_gzip:
+        plot_json = _render_plot_json_gzip(data_type, period, data_version, end_timestamp)
+    else:
+        plot_json = _render_plot_json(data_type, period, data_version, end_timestamp)
+
+    response = app.response_class(plot_json, mimetype='application/json')
+    if use_gzip:
+        response.content_encoding = 'gzip'
+    response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    return response
 
 @app.route('/users')
 def users():
     """Route that shows daily visitor statistics."""
     log_request_info()
     
-    server = WeatherWebServer()
+    server = get_server()
     
     # Get number of days from query parameter (default 30)
     try:
@@ -627,27 +987,10 @@ def users():
         days = 30  # Default to safe value
     
     # Get visitor statistics
-    stats = server.get_daily_visitor_stats(days)
+    stats, total_unique_ips = server.get_visitor_stats(days)
     
     # Calculate totals
-    total_unique_visitors = len(set()) if not stats else len(stats)
     total_requests = sum(stat['total_requests'] for stat in stats)
-    total_unique_ips = 0
-    
-    # Get total unique IPs across all days
-    try:
-        conn = sqlite3.connect(server.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT COUNT(DISTINCT ip_address) 
-            FROM user_requests
-            WHERE datetime(timestamp) >= datetime('now', '-{} days')
-        '''.format(days))
-        result = cursor.fetchone()
-        total_unique_ips = result[0] if result else 0
-        conn.close()
-    except Exception as e:
-        print(f"Error getting total unique IPs: {e}")
     
     # Prepare data for template
     template_data = {
@@ -663,27 +1006,23 @@ def users():
 
 def main():
     """Main function to run the web server."""
+    load_env_file()
+    
+    # LOG_LEVEL=DEBUG also logs every request with its headers
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(), format='%(asctime)s %(levelname)s %(message)s')
     try:
-        # Load .env file
-        env_path = project_root / '.env'
-        if env_path.exists():
-            with open(env_path) as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith('#') and '=' in line:
-                        key, value = line.split('=', 1)
-                        os.environ[key] = value
-        
         # Get port from environment or use default
         port = int(os.getenv('FLASK_PORT', 3300))
         
-        print(f"Starting weather web server on port {port}")
-        print(f"Open http://localhost:{port} in your browser")
+        logger.info(f"Starting weather web server on port {port}")
+        logger.info(f"Open http://localhost:{port} in your browser")
         
-        app.run(host='0.0.0.0', port=port, debug=True)
+        # The debugger and its reloader process are opt-in with FLASK_DEBUG=1. Requests are
+        # served on threads; use gunicorn (src/gunicorn.conf.py) for several processes
+        app.run(host='0.0.0.0', port=port, threaded=True)
         
     except Exception as e:
-        print(f"Error starting web server: {e}")
+        logger.error(f"Error starting web server: {e}")
         sys.exit(1)
 
 if __name__ == '__main__':
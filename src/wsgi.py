@@ -6,6 +6,7 @@ This file is used by Gunicorn to serve the Flask application.
 
 import os
 import sys
+import logging
 from pathlib import Path
 
 # Add the project root to the path
@@ -13,14 +14,11 @@ project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 # Load environment variables from .env file if it exists
-env_path = project_root / '.env'
-if env_path.exists():
-    with open(env_path) as f:
-        for line in f:
-            line = line.strip()
-            if line and not line.startswith('#') and '=' in line:
-                key, value = line.split('=', 1)
-                os.environ[key] = value
+from src.env import load_env_file
+load_env_file()
+
+# Application messages go to stderr next to gunicorn's own log; LOG_LEVEL=DEBUG logs every request
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(), format='%(asctime)s %(levelname)s %(message)s')
 
 # Import the Flask app from webserver module
 from src.webserver import app